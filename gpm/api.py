@@ -1,5 +1,11 @@
+import numpy as np
 import pandas as pd 
 from datetime import datetime 
+from importlib.util import find_spec
+from concurrent.futures import ThreadPoolExecutor
+
+# Faster multi-threaded CSV parser if available (only checked, pandas imports it when used)
+CSV_ENGINE = 'pyarrow' if find_spec('pyarrow') is not None else 'c'
 
 from .core import GPMClient 
 from .dates import get_missing_dates
@@ -9,32 +15,46 @@ def initialize_client(plants_filename: str, total_filename: str, inverter_filena
     """
     Initializes GPM client with all relevant Plant and DataSource information. 
     """
-    plants = pd.read_csv(plants_filename)
-    total_ds = pd.read_csv(total_filename)
-    inverter_ds = pd.read_csv(inverter_filename)
-    tracker_ds = pd.read_csv(tracker_filename)
+    # Only the id columns are used, read them with fixed dtypes
+    ds_kwargs = {
+        'usecols': ['PlantId', 'DataSourceId'],
+        'dtype': {'PlantId': np.int32, 'DataSourceId': np.int64},
+        'engine': CSV_ENGINE
+    }
+
+    # Files are independent, read them concurrently
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        plants = executor.submit(pd.read_csv, plants_filename, usecols=['PlantId'], dtype={'PlantId': np.int32}, engine=CSV_ENGINE)
+        total_ds, inverter_ds, tracker_ds = executor.map(
+            lambda filename: pd.read_csv(filename, **ds_kwargs), [total_filename, inverter_filename, tracker_filename]
+        )
+        plants = plants.result()
+
+    # One hashed groupby pass per table instead of masking every table once per plant
+    total_map = total_ds.groupby('PlantId')['DataSourceId'].agg(list).to_dict()
+    inverter_map = inverter_ds.groupby('PlantId')['DataSourceId'].agg(list).to_dict()
+    tracker_map = tracker_ds.groupby('PlantId')['DataSourceId'].agg(list).to_dict()
 
     datasources = {}
-    all_datasources = [] 
     for plant_id in plants['PlantId'].unique():
-        total = total_ds[total_ds['PlantId'] == plant_id]['DataSourceId'].to_list()
-        inverter = inverter_ds[inverter_ds['PlantId'] == plant_id]['DataSourceId'].to_list()
-        tracker = tracker_ds[tracker_ds['PlantId'] == plant_id]['DataSourceId'].to_list()
-
         datasources[plant_id] = {
-            'total': total,
-            'inverter': inverter,
-            'tracker': tracker
+            'total': total_map.get(plant_id, []),
+            'inverter': inverter_map.get(plant_id, []),
+            'tracker': tracker_map.get(plant_id, [])
         }
 
-        all_datasources.extend(total + inverter + tracker)
+    # Unique DataSourceIds across plants and concepts
+    all_datasources = set()
+    for plant in datasources.values():
+        for ids in plant.values():
+            all_datasources.update(ids)
 
     plant_ids = plants['PlantId'].to_list()
     gpm = GPMClient(username, password,
                     plant_ids=plant_ids,
                     concepts=concepts,
                     datasources=datasources)
-    gpm.all_datasources = all_datasources
+    gpm.all_datasources = list(all_datasources)
 
     return gpm
 
@@ -64,15 +84,28 @@ def get_data_for_range(client: GPMClient, start_date, end_date, datasourceids=No
         start_date = start 
         end_date = end 
         
-    # Get data from API
+    # Get data from API (already as a typed DataFrame if requested)
     data = client.get_data_list_in_batches(
         datasourceids, start_date, end_date,
-        grouping=grouping, granularity=granularity)
+        grouping=grouping, granularity=granularity, return_df=return_df)
     
     # Return new expanded dataframe 
     if return_df:
-        data = pd.concat([existing_df, pd.DataFrame(data)]) if existing_df is not None else pd.DataFrame(data)
-        data = data.drop_duplicates(subset=['Date', 'DataSourceId'])
+        keys = ['Date', 'DataSourceId']
+        new_df = data.drop_duplicates(subset=keys)
+        if existing_df is None:
+            return new_df
+        if new_df.empty:
+            return existing_df
+
+        # Dates from the API come parsed, so the existing ones must be too for keys to match
+        if not pd.api.types.is_datetime64_any_dtype(existing_df['Date']):
+            existing_df = existing_df.assign(Date=pd.to_datetime(existing_df['Date'], format='ISO8601', utc=True))
+
+        # Only append records missing from the existing dataframe, so it is copied once
+        existing_keys = existing_df.set_index(keys).index
+        new_df = new_df[~new_df.set_index(keys).index.isin(existing_keys)]
+        data = pd.concat([existing_df, new_df], ignore_index=True)
     
     # Else return raw data
     return data
@@ -1,15 +1,96 @@
+import os
+import time
+import orjson
 import requests
 import logging
+import threading
+import numpy as np
+import pandas as pd
+from itertools import chain
+from collections import deque, defaultdict
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 
 from .data import format_last_data
-from .dates import expected_measurement_count, split_dates_in_half
+from .dates import expected_measurement_count, to_datetime
+
+class Backpressure:
+    """
+    Adaptive concurrency limit for API calls (AIMD, as in TCP congestion control). The limit grows
+    additively by 'alpha' after each successful call while the latency over a sliding window stays
+    under target, and shrinks multiplicatively by 'beta' when the API signals overload (429/5xx).
+
+    Args:
+        concurrency (float): initial number of calls allowed in flight.
+        alpha (float): additive increase per successful call.
+        beta (float): multiplicative decrease factor on error.
+        c_min (int): lower bound for the concurrency limit.
+        c_max (int): upper bound for the concurrency limit.
+        latency_target (float): target mean latency (seconds). If None, twice the best latency
+            observed in the window is used.
+        window (int): number of latency samples kept in the sliding window.
+    """
+    def __init__(self, concurrency=8, alpha=0.5, beta=0.5, c_min=2, c_max=32, latency_target=None, window=20):
+        self.concurrency = float(concurrency)
+        self.alpha = alpha
+        self.beta = beta
+        self.c_min = c_min
+        self.c_max = c_max
+        self.latency_target = latency_target
+        self.latencies = deque(maxlen=window)
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        with self._condition:
+            while self._in_flight >= int(self.concurrency):
+                self._condition.wait()
+            self._in_flight += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+
+    def on_success(self, latency):
+        """
+        Additive increase while the windowed mean latency is under target.
+        """
+        with self._condition:
+            self.latencies.append(latency)
+            target = self.latency_target or 2 * min(self.latencies)
+            if sum(self.latencies) / len(self.latencies) <= target:
+                self.concurrency = min(self.c_max, self.concurrency + self.alpha)
+                self._condition.notify_all()
+
+    def on_error(self):
+        """
+        Multiplicative decrease on overload responses.
+        """
+        with self._condition:
+            self.concurrency = max(self.c_min, self.concurrency * self.beta)
+
+
+def retry_after(response, default=1.0):
+    """
+    Seconds to wait as requested by the 'Retry-After' header of a response (delay-seconds form only).
+    """
+    try:
+        return max(float(response.headers.get('Retry-After', default)), 0.0)
+    except ValueError:
+        return default
+
 
 class GPMClient:
     BASE_URL = 'https://webapisungrow.horizon.greenpowermonitor.com'
+    THROTTLE_STATUS = (429, 502, 503)
+    THROTTLE_RETRIES = 3
+    # Longest wait (seconds) between throttled retries, whatever the server asks for
+    THROTTLE_MAX_WAIT = 60
 
-    def __init__(self, username=None, password=None, plant_ids=None, concepts=None, datasources=None):
+    def __init__(self, username=None, password=None, plant_ids=None, concepts=None, datasources=None, max_workers=32):
         self.headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
         self.credentials = {
             'username': username or os.environ.get('GPM_API_USERNAME'),
@@ -18,84 +99,103 @@ class GPMClient:
 
         if not self.credentials['username'] or not self.credentials['password']:
             raise ValueError("GPM API credentials must be provided or set as environment variables 'GPM_API_USERNAME' and 'GPM_API_PASSWORD'")
-        
+
+        # Persistent HTTP session (keep-alive connection pool) and worker pool shared by all calls. Workers,
+        # pooled connections and the backpressure limit are all sized by 'max_workers'.
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=32, pool_maxsize=max_workers, max_retries=0))
+        self.session.headers.update(self.headers)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.backpressure = Backpressure(concurrency=min(8, max_workers), c_min=min(2, max_workers), c_max=max_workers)
+
         self.authenticate()
 
         self.plant_ids = plant_ids
         self.concepts = concepts
         self.datasources = datasources
 
+    @property
+    def datasources(self):
+        """
+        DataSourceIds per plant and concept, as {plant_id: {concept: [ids]}}. Assigning a new mapping
+        rebuilds the lookups used by 'filter_datasourceids' (mutating it in place does not).
+        """
+        return self._datasources
+
+    @datasources.setter
+    def datasources(self, datasources):
+        self._datasources = datasources
+        self._index_datasources()
+
+    def _index_datasources(self):
+        """
+        Precomputes the DataSourceId lookups per plant, per concept and per (plant, concept) used by
+        'filter_datasourceids'.
+        """
+        datasources = self._datasources or {}
+        self._by_plant = {pid: list(chain.from_iterable(concepts.values())) for pid, concepts in datasources.items()}
+        self._by_concept = defaultdict(list)
+        self._by_plant_concept = {}
+        for pid, concepts in datasources.items():
+            for concept, ids in concepts.items():
+                self._by_concept[concept].extend(ids)
+                self._by_plant_concept[pid, concept] = ids
+        self._all = list(set(chain.from_iterable(self._by_plant.values())))
+
     def filter_datasourceids(self, datasourceids=None, plant_id=None, concept=None):
         """
         Used to filter the DataSourceIds to fetch. Can pass either a list or dictionary
         
         """
-        data_dict = self.datasources
         if datasourceids is None and plant_id is None and concept is None:
-            all_datasources = []
-            for plant in data_dict.values():
-                for datasources in plant.values():
-                    all_datasources.extend(datasources)
-            return list(set(all_datasources))
-        
-        result = []
+            return list(self._all)
 
         if datasourceids:
             if isinstance(datasourceids, list):
                 return datasourceids 
             elif isinstance(datasourceids, dict):
-                for item in data_dict.values():
-                    for key, value in item.items():
-                        if key in datasourceids:
-                            result.extend(value)
+                return [ds for c in datasourceids for ds in self._by_concept.get(c, [])]
             
         elif isinstance(plant_id, (int, list)) and not concept:
-            if isinstance(plant_id, int):
-                plant_id = [plant_id]
-            for pid in plant_id:
-                for item in data_dict.get(pid, {}).values():
-                    result.extend(item)
+            plant_id = plant_id if isinstance(plant_id, list) else [plant_id]
+            return [ds for pid in plant_id for ds in self._by_plant.get(pid, [])]
         
         elif isinstance(concept, (str, list)) and not plant_id:
-            if isinstance(concept, str):
-                concept = [concept]
-            for item in data_dict.values():
-                for key, value in item.items():
-                    if key in concept:
-                        result.extend(value)
+            concept = concept if isinstance(concept, list) else [concept]
+            return [ds for c in concept for ds in self._by_concept.get(c, [])]
         
         elif plant_id and concept:
-            if isinstance(plant_id, list) and isinstance(concept, list):
-                for pid in plant_id:
-                    for c in concept:
-                        item = data_dict.get(pid, {}).get(c, [])
-                        result.extend(item)
+            if isinstance(plant_id, (int, list)) and isinstance(concept, (str, list)):
+                plant_id = plant_id if isinstance(plant_id, list) else [plant_id]
+                concept = concept if isinstance(concept, list) else [concept]
+                return [ds for pid in plant_id for c in concept for ds in self._by_plant_concept.get((pid, c), [])]
 
-            elif isinstance(plant_id, int) and isinstance(concept, str):
-                item = data_dict.get(plant_id, {}).get(concept, [])
-                result.extend(item)
+        return []
 
-            elif isinstance(plant_id, int) and isinstance(concept, list):
-                for c in concept:
-                    item = data_dict.get(plant_id, {}).get(c, [])
-                    result.extend(item)
-
-            elif isinstance(plant_id, list) and isinstance(concept, str):
-                for pid in plant_id:
-                    item = data_dict.get(pid, {}).get(concept, [])
-                    result.extend(item)
+    def close(self):
+        """
+        Shuts down the worker pool and closes the underlying HTTP session.
+        """
+        self._executor.shutdown(wait=True)
+        self.session.close()
 
-        return result
+    def __del__(self):
+        # Client may be partially initialized if credentials were missing
+        if hasattr(self, '_executor'):
+            self._executor.shutdown(wait=False)
+        if hasattr(self, 'session'):
+            self.session.close()
 
     def authenticate(self):
         """
         Internal method for API authentication via bearer token.
         """
         url = self.BASE_URL + '/api/Account/Token'
-        response = requests.post(url, headers=self.headers, json=self.credentials)
+        response = self.session.post(url, data=orjson.dumps(self.credentials))
         if response.status_code == 200:
-            res = response.json()
+            res = orjson.loads(response.content)
             self.headers['Authorization'] = 'Bearer ' + res['AccessToken']
+            self.session.headers.update(self.headers)
             logging.info(f'[GPM]: Authentication successful')
         else:
             logging.error(f'[GPM]: Failed to authenticate user. Status code: {response.status_code}')
@@ -113,23 +213,39 @@ class GPMClient:
             Response JSON if the call is succesfull, else status code. 
         """
         url = self.BASE_URL + endpoint
-        try:
-            if endpoint == '/api/Account/Token':
-                response = requests.post(url, headers=self.headers, json=data)
-            else:
-                response = requests.get(url, headers=self.headers, params=data)
-
-            if response.status_code in [200, 206]:
-                return response.json()
-            elif response.status_code == 416:
-                return 416
-            else:
-                logging.warning(f'[GPM]: Got response with status code {response.status_code}')
-                return response.json()
-            
-        except Exception as e:
-            logging.error(f'[GPM]: Exception in API call: {e}')
-            return None
+        for attempt in range(self.THROTTLE_RETRIES + 1):
+            try:
+                with self.backpressure:
+                    start = time.monotonic()
+                    if endpoint == '/api/Account/Token':
+                        response = self.session.post(url, data=orjson.dumps(data))
+                    else:
+                        response = self.session.get(url, params=data)
+                    latency = time.monotonic() - start
+
+                if response.status_code in [200, 206]:
+                    self.backpressure.on_success(latency)
+                    return orjson.loads(response.content)
+                elif response.status_code == 416:
+                    return 416
+                elif response.status_code in self.THROTTLE_STATUS:
+                    # Server is overloaded: reduce concurrency and wait before retrying
+                    self.backpressure.on_error()
+                    if attempt == self.THROTTLE_RETRIES:
+                        break
+                    wait = min(retry_after(response), self.THROTTLE_MAX_WAIT)
+                    logging.warning(f'[GPM]: Got response with status code {response.status_code}, retrying in {wait}s')
+                    time.sleep(wait)
+                else:
+                    logging.warning(f'[GPM]: Got response with status code {response.status_code}')
+                    return orjson.loads(response.content)
+
+            except Exception as e:
+                logging.error(f'[GPM]: Exception in API call: {e}')
+                return None
+
+        logging.error(f'[GPM]: Max. retries reached for {endpoint}')
+        return None
         
     def get_plant_information(self):
         """ 
@@ -207,13 +323,17 @@ class GPMClient:
                 formatted_data[concept] = format_last_data(res, ds_ids, tuples=tuples)
         return formatted_data
     
-    def get_last_data_for_all_plants(self):
+    def get_last_data_for_all_plants(self, return_df=False):
         """
         Gets last available measurement for all DataSources and all plants. The 'self.datasources' object 
         must be initialized as a dictionary of the form:
 
             { plant_id: { 'concept': [datasource_ids] } }
 
+        Args:
+            return_df (bool): to return a single DataFrame with 'PlantId' and 'Concept' columns instead
+                of the nested dictionary.
+
         Returns:
             A dictionary containing all measurements per concept, PlantId. It has the form:
 
@@ -221,18 +341,25 @@ class GPMClient:
         
         """
         data = {plant_id: {concept: [] for concept in self.concepts} for plant_id in self.plant_ids}
-
-        with ThreadPoolExecutor() as executor:
-            futures = {executor.submit(self.get_last_data, plant_id, self.datasources[plant_id]): plant_id for plant_id in self.plant_ids}
-
-            for future in as_completed(futures):
-                plant_id = futures[future]
-                try:
-                    result = future.result()
-                    for key in result:
+        frames = []
+
+        futures = {self._executor.submit(self.get_last_data, plant_id, self.datasources[plant_id]): plant_id for plant_id in self.plant_ids}
+
+        for future in as_completed(futures):
+            plant_id = futures[future]
+            try:
+                result = future.result()
+                for key in result:
+                    if return_df:
+                        frames.append(pd.DataFrame(result[key]).assign(PlantId=plant_id, Concept=key))
+                    else:
                         data[plant_id][key].extend(result[key])
-                except Exception as exc:
-                    print(f'PlantId {plant_id} generated an exception: {exc}')
+            except Exception as exc:
+                print(f'PlantId {plant_id} generated an exception: {exc}')
+
+        # Single concat once all plants are collected
+        if return_df:
+            return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
 
         return data
 
@@ -242,8 +369,8 @@ class GPMClient:
 
         Args:
             datasources (list): List of DataSourceIds to query.
-            start_date (str): Start date in ISO8061 format.
-            end_date (str): End date in ISO8061 format.
+            start_date (str or datetime): Start date in ISO8061 format.
+            end_date (str or datetime): End date in ISO8061 format.
             grouping (str): Time-grouping for response.
             granularity (int): Granularity for the time-grouping parameter.
 
@@ -257,36 +384,47 @@ class GPMClient:
                     "Value": 55.43
                 }
         """
+        ids = ','.join(map(str, datasources))
+        return self._get_data_list(ids, to_datetime(start_date), to_datetime(end_date), grouping, granularity)
+
+    def _get_data_list(self, ids, start_date, end_date, grouping, granularity):
+        """
+        Same as 'get_data_list', but takes the DataSourceIds already joined as a comma separated string
+        and datetime objects, so that the recursive range bisection on HTTP 416 reuses both as is.
+        """
         params = {
-            'startDate': start_date,
-            'endDate': end_date,
+            'startDate': start_date.isoformat(timespec='seconds'),
+            'endDate': end_date.isoformat(timespec='seconds'),
             'grouping': grouping,
             'granularity': granularity,
-            'dataSourceIds': ','.join(map(str, datasources))
+            'dataSourceIds': ids
         }
 
         res = self.make_api_call('/api/DataList/v2', params)
 
         if res == 416: # HTTP 416 - Range not satisfiable
-            midpoint = split_dates_in_half(start_date, end_date)
-            first_half = self.get_data_list(datasources, start_date, midpoint, grouping, granularity)
-            second_half = self.get_data_list(datasources, midpoint, end_date, grouping, granularity)
+            midpoint = (start_date + (end_date - start_date) / 2).replace(microsecond=0)
+            first_half = self._get_data_list(ids, start_date, midpoint, grouping, granularity)
+            second_half = self._get_data_list(ids, midpoint, end_date, grouping, granularity)
             return first_half + second_half if first_half and second_half else []
         
         return res
 
-    def get_data_list_in_batches(self, datasources, start_date, end_date, grouping='minute', granularity=5, max_retries=3):
+    def get_data_list_in_batches(self, datasources, start_date, end_date, grouping='minute', granularity=5, max_retries=3,
+                                 return_df=False):
         """ 
         Uses the get_data_list method to fetch data for multiple DataSourceIds. Handles incomplete responses
         (HTTP 206) by making subsequent calls and waiting until all datasources have complete data.
 
         Args:
             datasources (list): List of DataSourceIds to query.
-            start_date (str): Start date in ISO8061 format.
-            end_date (str): End date in ISO8061 format.
+            start_date (str or datetime): Start date in ISO8061 format.
+            end_date (str or datetime): End date in ISO8061 format.
             grouping (str): Time-grouping for response.
             granularity (int): Granularity for the time-grouping parameter.
             max_retries (int): Max. number of retries in case of 206 response.
+            return_df (bool): to return a DataFrame with "DataSourceId", "Date" and "Value" columns,
+                built from columnar buffers, instead of the list of records.
 
         Returns:
             The response, which is a list of dictionaries, each representing
@@ -301,38 +439,59 @@ class GPMClient:
         def fetch_data(sources):
             """
             Fetches data in parrallel, batching all DataSourceIds into a maximum of 10 per call (API internal limit).
+            Yields each batch response in submission order (so the output order is deterministic), as soon
+            as it and the batches before it complete.
             """
-            batches = [sources[i:i + 10] for i in range(0, len(sources), 10)]
+            batches = [','.join(map(str, sources[i:i + 10])) for i in range(0, len(sources), 10)]
             
-            # Make parallel calls
-            with ThreadPoolExecutor() as executor:
-                futures = [executor.submit(self.get_data_list, batch, start_date, end_date, grouping, granularity) for batch in batches]
-                results = [future.result() for future in futures]
-
-            # Combine all responses
-            combined = []
-            for result in results: 
-                if result is not None:
-                    combined.extend(result)
-            return combined
+            # Make parallel calls on the client's persistent worker pool
+            futures = [self._executor.submit(self._get_data_list, ids, start_date, end_date, grouping, granularity) for ids in batches]
+            for future in futures:
+                result = future.result()
+                if isinstance(result, list):
+                    yield result
+
+        # Parse dates once for all batches and retries
+        start_date = to_datetime(start_date)
+        end_date = to_datetime(end_date)
 
         # Expected number of datapoints for each DataSourceId
         expected_count = expected_measurement_count(start_date, end_date, grouping, granularity)
 
         retry_count = 0
         complete_data = []
+        id_chunks, dates, values = [], [], []
         while datasources and retry_count < max_retries:
-            data = fetch_data(datasources)
-            complete_data.extend(data)
+            round_ids = []
+            for data in fetch_data(datasources):
+                # Move records into columnar buffers as batches arrive, dropping each response right away
+                round_ids.extend(item['DataSourceId'] for item in data)
+                if return_df:
+                    dates.extend(item['Date'] for item in data)
+                    values.extend(item['Value'] for item in data)
+                else:
+                    complete_data.extend(data)
+
+            ids = np.asarray(round_ids, dtype=np.int64)
+            if return_df:
+                id_chunks.append(ids)
+
+            # Unsupported groupings have no expected count to check against, so there is nothing to retry
+            if expected_count <= 0:
+                break
 
             # Count datapoints per DataSourceId
-            response_counts = {ds: 0 for ds in datasources}
-            for item in data:
-                if item['DataSourceId'] in response_counts:
-                    response_counts[item['DataSourceId']] += 1
+            counts = pd.Series(ids).value_counts()
 
             # Check condition and filter already complete DataSourceIds
-            datasources = [ds for ds, count in response_counts.items() if count < expected_count]
+            datasources = [ds for ds in datasources if counts.get(ds, 0) < expected_count]
             retry_count += 1
 
-        return complete_data
\ No newline at end of file
+        if return_df:
+            return pd.DataFrame({
+                'DataSourceId': np.concatenate(id_chunks) if id_chunks else np.empty(0, dtype=np.int64),
+                'Date': pd.to_datetime(dates, format='ISO8601', utc=True, cache=True),
+                'Value': np.asarray(values, dtype=np.float64)
+            })
+
+        return complete_data
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd 
 
 field_mapper = {
@@ -14,7 +15,8 @@ field_mapper = {
     }
 
 def merge_and_pivot(df, ds, index_col=['PlantId', 'Date'], merge_col='DataSourceId', field_col='DataSourceName',
-                    value_col='Value', duplicate_col=['DataSourceId', 'Date'], field_mapper=None, pivot=True, set_datetime=True):
+                    value_col='Value', duplicate_col=['DataSourceId', 'Date'], field_mapper=None, pivot=True, set_datetime=True,
+                    aggfunc='mean'):
     """
     Merges two dataframes on a common column and applies a pivot operation, resulting in a dataframe with column
     names that correspond to the values present in the "ds" dataframe for the "field_col" column. Optionally, it 
@@ -35,43 +37,83 @@ def merge_and_pivot(df, ds, index_col=['PlantId', 'Date'], merge_col='DataSource
             dictionary gets dropped after the merge operation.
         pivot (bool): to pivot the dataframe or not. If not, returns the merged dataframe.
         set_datetime (bool): to set the "Date" column to DateTime or not in the data dataframe ("df"). 
+        aggfunc (str or function): aggregation used only when several data points fall in the same pivoted
+            cell (i.e. different DataSourceNames mapped to the same column by "field_mapper").
 
     Returns:
         A Pandas DataFrame.  
     """
-    # Drop duplicate rows
+    # Drop duplicate rows (input dataframes are never modified)
     if duplicate_col:
-        df.drop_duplicates(subset=duplicate_col, inplace=True)
+        df = df.drop_duplicates(subset=duplicate_col)
 
-    # Set datetime column
-    if set_datetime:
-        df['Date'] = pd.to_datetime(df['Date'])
+    # Set datetime column (upstream dates are always ISO8601, e.g. "2024-01-22T15:00:00.753Z")
+    if set_datetime and not pd.api.types.is_datetime64_any_dtype(df['Date']):
+        df = df.assign(Date=pd.to_datetime(df['Date'], format='ISO8601', cache=True, utc=True))
         
-    # Set merge column as index to speed up merge operation
-    df.set_index(merge_col, inplace=True)
-    ds.set_index(merge_col, inplace=True)
+    # Attach DataSource information with lookups on the (small) "ds" table instead of a merge. Rows
+    # with unknown DataSourceIds are dropped, as in an inner merge. When pivoting, only the columns
+    # needed for the pivot are looked up.
+    index_cols = [index_col] if isinstance(index_col, str) else list(index_col or [])
+    columns = [col for col in ds.columns if col != merge_col and (not pivot or col == field_col or col in index_cols)]
+    lookup = ds[[merge_col] + columns].set_index(merge_col)
 
-    # Merge
-    merged = pd.merge(df, ds, on=merge_col, how='inner')
+    # Same check as a many-to-one merge validation: each DataSource must be described only once
+    if not lookup.index.is_unique:
+        raise ValueError(f'"ds" dataframe contains duplicated values in the "{merge_col}" column.')
+
+    merged = df[df[merge_col].isin(lookup.index)].copy()
+    for col in lookup.columns:
+        merged[col] = merged[merge_col].map(lookup[col])
 
     # Clean and filter DataSourceNames if mapper passed 
     if field_mapper:
-        merged[field_col] = merged[field_col].map(field_mapper).fillna('drop')
-        merged = merged[merged[field_col] != 'drop']
+        merged[field_col] = remap_categories(merged[field_col], field_mapper)
+        merged = merged[merged[field_col].notna()]
 
     # Return merged dataframe if chosen
     if not pivot: 
         # Set index column if given
         if index_col:
-            return merged.reset_index().set_index(index_col)
-        return merged
+            return merged.set_index(index_col)
+        return merged.set_index(merge_col)
 
-    # Pivot
-    pivoted = merged.pivot_table(index=index_col, columns=field_col, values=value_col)
+    # Pivot (categorical field column so group keys are integer codes). Data points are unique per cell
+    # unless the mapper merged several DataSourceNames, only then aggregate.
+    merged[field_col] = merged[field_col].astype('category')
+    try:
+        pivoted = merged.pivot(index=index_col, columns=field_col, values=value_col)
+    except ValueError:
+        pivoted = merged.groupby(index_cols + [field_col], observed=True)[value_col].agg(aggfunc).unstack(field_col)
+    # Like pivot_table, drop dates and fields without any value (e.g. timestamps with null readings)
+    pivoted = pivoted.dropna(how='all').dropna(axis=1, how='all')
+    pivoted.columns = pivoted.columns.astype(object)
     pivoted.columns.name = None
 
     return pivoted
 
+def remap_categories(series, mapper):
+    """
+    Maps the values of a Series through a dict working on its categories only, so the column itself is
+    only traversed as integer codes. Several values may map to the same one. Values that are not keys 
+    of the mapper become NaN.
+
+    Args:
+        series (Pandas Series): values to map, cast to categorical if needed.
+        mapper (dict): original values as keys and new values as values.
+
+    Returns:
+        A categorical Pandas Series.
+    """
+    series = series.astype('category')
+    targets = series.cat.categories.map(mapper)
+    categories = pd.Index(targets.dropna().unique())
+
+    # New code for each old code, with a trailing -1 so that missing values (code -1) stay missing
+    recode = np.append(categories.get_indexer(targets), -1)
+    codes = recode[series.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, categories), index=series.index, name=series.name)
+
 def format_last_data(response, datasourceids, tuples=False):
     """
     Filters a response coming from the 'get_last_data' method in the GPMClient class in core package.
@@ -93,19 +135,20 @@ def format_last_data(response, datasourceids, tuples=False):
             {
                 'DataSourceId': item['DataSourceId'],
                 #'DataSourceName': item['DataSourceName'],
-                'Date': item['LastValue']['Date'],
-                'Value': item['LastValue']['Value']
+                'Date': last['Date'],
+                'Value': last['Value']
             }
-            for item in response if item['DataSourceId'] in datasourceids
+            for item in response if item['DataSourceId'] in datasourceids and (last := item['LastValue'])
         ]
     
     else:
+        # ISO8601 dates are fixed width (YYYY-MM-DDThh:mm:ss...), so slice instead of replace + split
         return [
             (   
-                item['LastValue']['Date'].replace('T', ' ').split('.')[0],
+                (date := last['Date'])[:10] + ' ' + date[11:19],
                 int(item['DataSourceId']),
-                float(item['LastValue']['Value'])
+                float(last['Value'])
             )
-            for item in response if item['DataSourceId'] in datasourceids
+            for item in response if item['DataSourceId'] in datasourceids and (last := item['LastValue'])
         ]
 
@@ -1,7 +1,14 @@
+import numpy as np
 import pandas as pd 
 from datetime import datetime, timedelta 
+from functools import lru_cache
 from dateutil.parser import parse as parse_date
 
+# Latest measurements are not expected to be available yet
+_STALE_DELTA = timedelta(minutes=15)
+# By default GPM starts at 00:05:00 for each day and ends at 00:00:00
+_START_OFFSET = timedelta(minutes=5)
+
 def get_missing_dates(df, start_date, end_date, plant_id=None, grouping='minute', granularity=1):
     """
     Gets missing dates in a Pandas DataFrame, checking for a complete index. 
@@ -17,22 +24,9 @@ def get_missing_dates(df, start_date, end_date, plant_id=None, grouping='minute'
     TO DO:
         - add mapper from 'grouping' and 'granularity' to Pandas frequency. 
     """
-    def check_datetime_index(df):
-        if isinstance(df.index, pd.DatetimeIndex):
-            return True
-        elif isinstance(df.index, pd.MultiIndex):
-            for level in df.index.levels:
-                if isinstance(level, pd.DatetimeIndex):
-                    return True
-        return False 
-                
-    if plant_id: 
+    if plant_id is not None: 
         df = df.loc[plant_id]
 
-    if isinstance(start_date, str):
-        start_date = datetime.strptime(start_date, '%Y-%m-%dT%H:%M:%S')
-        end_date = datetime.strptime(end_date, '%Y-%m-%dT%H:%M:%S')
-
     start_date = floor_and_format(start_date)
     end_date = floor_and_format(end_date)
 
@@ -43,13 +37,35 @@ def get_missing_dates(df, start_date, end_date, plant_id=None, grouping='minute'
         except ValueError:
             raise Exception('DataFrame contains no DatetimeIndex or "Date" column.')
 
-    df = df[(df.index.get_level_values('Date') >= start_date) & (df.index.get_level_values('Date') <= end_date)]
+    # Slice the sorted index on the Date level (binary search) instead of masking the whole level
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index()
+    # Bounds take the index timezone (GPM dates are UTC), naive and aware dates can't be compared
+    if isinstance(df.index, pd.MultiIndex):
+        tz = df.index.levels[df.index.names.index('Date')].tz
+    else:
+        tz = df.index.tz
+    date_slice = slice(pd.Timestamp(start_date).tz_localize(tz), pd.Timestamp(end_date).tz_localize(tz))
+    if isinstance(df.index, pd.MultiIndex):
+        df = df.loc[tuple(date_slice if name == 'Date' else slice(None) for name in df.index.names), :]
+    else:
+        df = df.loc[date_slice]
 
     # Check missing, using default granularity (5MIN) for now
     missing_start, missing_end = check_complete_index(df, start_date, end_date)
     return missing_start, missing_end
 
-def check_complete_index(df, start_date, end_date, freq='5MIN'):
+def check_datetime_index(df):
+    """
+    Checks wether a Pandas DataFrame has a DatetimeIndex, or a MultiIndex with a DatetimeIndex level.
+    """
+    if isinstance(df.index, pd.DatetimeIndex):
+        return True
+    elif isinstance(df.index, pd.MultiIndex):
+        return any(isinstance(level, pd.DatetimeIndex) for level in df.index.levels)
+    return False 
+
+def check_complete_index(df, start_date, end_date, freq='5MIN', _now=None):
     """
     Checks wether a Pandas DataFrame with DateTime index with name 'Date' is complete or not.
     For now only accepts whole dates with daily granularity! (i.e. 2024-01-25T00:00:00)
@@ -59,40 +75,50 @@ def check_complete_index(df, start_date, end_date, freq='5MIN'):
         end_date (str): date in 'YYYY-MM-DDThh:mm:ss' format
         freq (str): date frequency expected in the index as of Pandas documentation (see 
             https://pandas.pydata.org/pandas-docs/stable/user_guide/timeseries.html#offset-aliases)
+        _now (datetime): current time, to avoid looking it up on every call when checking many DataFrames.
         
     Returns: 
 
     """
-    # Parse dates 
-    start_date = parse_date(start_date)
-    end_date = min(parse_date(end_date), datetime.now() - timedelta(minutes=15))
-
-    # Construct expected index
-    # By default GPM starts at 00:05:00 for each day and ends at 00:00:00
-    expected_range = pd.date_range(start_date + timedelta(minutes=5), end_date, freq=freq)
-
-    # Calculate difference 
-    diff = expected_range.difference(df.index.get_level_values('Date'))
-    if diff.empty: return None, None
+    # Parse dates (datetimes are used as they are)
+    if not isinstance(start_date, datetime):
+        start_date = parse_date(start_date)
+    if not isinstance(end_date, datetime):
+        end_date = parse_date(end_date)
+    end_date = min(end_date, (_now or datetime.now()) - _STALE_DELTA)
+
+    # Construct expected index (in seconds). Bounds are snapped to the freq grid, so windows capped at
+    # 'now' (which has microseconds) convert to seconds losslessly and share the cache entry.
+    start_ns = pd.Timestamp(start_date + _START_OFFSET).ceil(freq).value
+    end_ns = pd.Timestamp(end_date).floor(freq).value
+    expected = expected_index(start_ns, end_ns, freq)
+
+    # Calculate difference on sorted int64 views (same time unit), without boxing every Timestamp
+    actual = df.index.get_level_values('Date').unique().as_unit('s')
+    diff = np.setdiff1d(expected, actual.asi8, assume_unique=True)
+    if diff.size == 0: return None, None
 
     # Extract only days from missing dates 
-    start = diff[0].normalize()
-    end = diff[-1].normalize() + timedelta(days=1)
+    start = pd.Timestamp(diff[0], unit='s').normalize()
+    end = pd.Timestamp(diff[-1], unit='s').normalize() + timedelta(days=1)
 
     return start, end
 
+@lru_cache(maxsize=256)
+def expected_index(start_ns, end_ns, freq):
+    """ 
+    Expected DatetimeIndex between two dates (given as nanoseconds since epoch), as a read-only array of
+    seconds since epoch. Cached, so repeated checks over the same window skip the range construction.
+    """
+    expected = pd.date_range(pd.Timestamp(start_ns), pd.Timestamp(end_ns), freq=freq, unit='s').asi8
+    expected.flags.writeable = False
+    return expected
+
 def expected_measurement_count(start_date, end_date, grouping, granularity):
     """ 
     Get expected number of data points depending on the grouping and granularity chosen.
     """
-    if isinstance(start_date, str):
-        start_datetime = datetime.strptime(start_date, '%Y-%m-%dT%H:%M:%S')
-        end_datetime = datetime.strptime(end_date, '%Y-%m-%dT%H:%M:%S')
-    else:
-        start_datetime = start_date 
-        end_datetime = end_date 
-    
-    delta = end_datetime - start_datetime
+    delta = to_datetime(end_date) - to_datetime(start_date)
 
     if grouping == 'minute':
         total_minutes = delta.total_seconds() / 60
@@ -106,17 +132,24 @@ def expected_measurement_count(start_date, end_date, grouping, granularity):
     else:
         return 0
     
-def split_dates_in_half(start_date, end_date):
-    start_datetime = datetime.strptime(start_date, '%Y-%m-%dT%H:%M:%S')
-    end_datetime = datetime.strptime(end_date, '%Y-%m-%dT%H:%M:%S')
-    midpoint = start_datetime + (end_datetime - start_datetime) / 2
-    midpoint_str = midpoint.strftime('%Y-%m-%dT%H:%M:%S')
-    return midpoint_str
+def to_datetime(date):
+    """
+    Returns the date as a datetime, parsing it if given as an ISO8061 string (i.e 2024-01-24T12:15:00).
+    """
+    if isinstance(date, str):
+        return _parse_iso(date)
+    return date
+
+@lru_cache(maxsize=4096)
+def _parse_iso(date):
+    # The same few dates are parsed over and over (per plant, per day), datetimes are immutable so cache them
+    return datetime.fromisoformat(date)
 
 def floor_and_format(date):
     """ 
     Floors the date's minutes to the closest 5min multiple and formats the date
-    to ISO8061 (i.e 2024-01-24T12:15:00)
+    to ISO8061 (i.e 2024-01-24T12:15:00). Accepts datetimes or ISO8061 strings.
     """
+    date = to_datetime(date)
     round_minutes = (date.minute - date.minute % 5)
     return date.replace(minute=round_minutes, second=0).isoformat(timespec='seconds')
\ No newline at end of file
@@ -1,8 +1,22 @@
 import pandas as pd 
 from datetime import datetime
+from itertools import islice
+from importlib.util import find_spec
+from collections import deque
 from dateutil.relativedelta import relativedelta
+from concurrent.futures import ThreadPoolExecutor
+
+# Faster Excel writer if available (None lets pandas pick its default engine)
+EXCEL_ENGINE = 'xlsxwriter' if find_spec('xlsxwriter') is not None else None
 
 from .core import PRMTEClient
+from .data import transform_records
+
+# Number of periods requested concurrently
+MAX_WORKERS = 8
+# Number of assets requested concurrently, each one with up to MAX_WORKERS periods in flight
+# (keeps the total within the client's connection pool)
+ASSET_WORKERS = 2
 
 def get_coordinados(client: PRMTEClient):
     """ 
@@ -89,22 +103,46 @@ def get_measurements(client: PRMTEClient, idPuntoMedida: str, period: str, end_p
         periods.append(current.strftime("%Y%m"))
         current += relativedelta(months=1)
 
-    all_frames = []
-    last_reading = None
+    # Periods are independent, request them concurrently (results keep the periods order)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        responses = list(executor.map(lambda per: client.get_measurements(idPuntoMedida, per), periods))
 
-    for per in periods:
-        records, last_reading = client.get_measurements(idPuntoMedida, per)
+    all_frames, fetched = [], []
+    for per, (records, last_reading) in zip(periods, responses):
         if not records:
             continue
-        df = transform_records(records, last_reading, format=df_format)
-        if granularity:
-            df = df.resample(granularity).sum()
-        all_frames.append(df)
+        all_frames.append(transform_records(records, last_reading, format=df_format))
+        fetched.append(per)
 
     if not all_frames:
         return pd.DataFrame()
 
-    return pd.concat(all_frames).sort_index()
+    # Periods are in order and each frame is sorted by date, so the result needs no sort
+    total = pd.concat(all_frames)
+    if granularity:
+        total = _resample_periods(total, granularity, fetched)
+    return total
+
+
+def _resample_periods(df, granularity, periods):
+    """
+    Resamples measurements concatenated from several periods in a single pass, so bins at period seams
+    are merged. Empty bins within the fetched periods are zero, as when resampling each period on its
+    own, while empty bins in between (e.g. skipped or broken periods) are dropped. Only numeric columns
+    are summed, "idPuntoMedida" (categorical) is dropped.
+
+    Args:
+        df (pd.DataFrame): measurements with a DatetimeIndex.
+        granularity (str): resampling rule as of Pandas documentation.
+        periods (list): periods in YYYYMM format the measurements were fetched for.
+
+    Returns:
+        The resampled DataFrame.
+    """
+    df = df.resample(granularity).sum(numeric_only=True, min_count=1)
+    fetched = pd.to_datetime(periods, format='%Y%m').to_period('M')
+    keep = df.index.to_period('M').isin(fetched) | df.notna().any(axis=1).to_numpy()
+    return df[keep].fillna(0)
 
 
 def get_measurements_range(
@@ -134,7 +172,8 @@ def get_measurements_range(
     )
     
 
-def get_historic_measurements(client: PRMTEClient, idPuntoMedida: str, broken_periods=[], granularity='1H', df_format='consolidated'):
+def get_historic_measurements(client: PRMTEClient, idPuntoMedida: str, broken_periods=[], granularity='1H', df_format='consolidated',
+                              oldest_period=None):
     """
     Get all measurements up until the last measurement available. 
 
@@ -147,28 +186,50 @@ def get_historic_measurements(client: PRMTEClient, idPuntoMedida: str, broken_pe
             https://pandas.pydata.org/pandas-docs/stable/user_guide/timeseries.html#offset-aliases)
         df_format (str): either 'consolidated' or 'columns'. See 'transform_records' function in 
             data package for more information on this parameter.
+        oldest_period (str): optional oldest period to request, in YYYYMM format. By default the walk
+            back only stops at the first empty period.
         
 
     Returns: 
         A Pandas DataFrame with the historic data for that measurement point.
     """
-    i = 0
     now = datetime.now()
-    total = pd.DataFrame()
-
-    while True:
-        period = (now - relativedelta(months=i)).strftime("%Y%m"); i += 1
-        records, last_reading = client.get_15min_readings(idPuntoMedida, period)
-
-        if not records:
-            if period in broken_periods: continue 
-            else: break
 
-        df = transform_records(records, last_reading, format=df_format).reset_index()
-        df = df.drop(columns=['idPuntoMedida']).set_index('date').resample(granularity).sum()
-        total = pd.concat([total, df], axis=0)
+    def months_back():
+        offset = 0
+        while True:
+            period = (now - relativedelta(months=offset)).strftime("%Y%m")
+            if oldest_period and period < oldest_period:
+                return
+            yield period
+            offset += 1
+
+    frames, fetched = [], []
+    periods = months_back()
+
+    # Walk back in time keeping MAX_WORKERS periods in flight (a new one is requested as soon as the oldest
+    # pending one arrives, instead of waiting for whole blocks), until the first empty period
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        def submit(period):
+            return period, executor.submit(client.get_15min_readings, idPuntoMedida, period)
+
+        window = deque(submit(period) for period in islice(periods, MAX_WORKERS))
+        while window:
+            period, future = window.popleft()
+            records, last_reading = future.result()
+            if not records and period not in broken_periods:
+                break
+
+            window.extend(submit(period) for period in islice(periods, 1))
+            if records:
+                frames.append(transform_records(records, last_reading, format=df_format, drop_id=True))
+                fetched.append(period)
+
+    if not frames:
+        return pd.DataFrame()
 
-    return total
+    # Frames go newest first, concatenate once in chronological order and resample
+    return _resample_periods(pd.concat(frames[::-1], axis=0), granularity, fetched)
 
 
 def get_daily_energy(client: PRMTEClient, idPuntoMedida: str, period: str, end_period=None):
@@ -232,8 +293,8 @@ def measurements_to_excel(
     mapping_df = pd.DataFrame(list(assets.items()), columns=['asset_name', 'idPuntoMedida'])
     frames = []
 
-    for asset_name, mp_id in assets.items():
-        df = get_measurements_range(
+    def fetch(mp_id):
+        return get_measurements_range(
             client,
             mp_id,
             start_period=period,
@@ -241,6 +302,12 @@ def measurements_to_excel(
             granularity=granularity,
             df_format=internal_format,
         ).reset_index()
+
+    # Assets are independent, request them concurrently (results keep the assets order)
+    with ThreadPoolExecutor(max_workers=ASSET_WORKERS) as executor:
+        results = list(executor.map(fetch, assets.values()))
+
+    for asset_name, df in zip(assets, results):
         if df.empty:
             continue
         df['asset_name'] = asset_name
@@ -251,7 +318,7 @@ def measurements_to_excel(
     if df_format.lower() == 'wide' and not measurements.empty:
         measurements = measurements.pivot_table(index='date', columns='asset_name', values='value')
 
-    with pd.ExcelWriter(filename) as writer:
+    with pd.ExcelWriter(filename, engine=EXCEL_ENGINE) as writer:
         mapping_df.to_excel(writer, sheet_name='assets', index=False)
         measurements.to_excel(writer, sheet_name='measurements')
 
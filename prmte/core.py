@@ -1,7 +1,14 @@
 import os
+import json
+import hashlib
 import logging
+import tempfile
 import requests
 import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
+from requests.adapters import HTTPAdapter, Retry
 
 class PRMTEClient:
     """Simple wrapper for the public PRMTE API."""
@@ -21,11 +28,26 @@ class PRMTEClient:
         'measurement',
     ]
 
-    def __init__(self, api_key=None):
+    # Seconds to wait for the server before giving up on a request
+    TIMEOUT = 30
+
+    # Complete responses for past periods do not change. When caching is enabled they are kept on disk
+    # in this directory by default, delete it (or the files in it) to invalidate the cache.
+    CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'prmte')
+
+    def __init__(self, api_key=None, cache_dir=None, use_cache=False):
         self.api_key = api_key or os.environ.get('PRMTE_API_KEY')
         if not self.api_key:
             raise ValueError("API key must be provided or set as an environment variable 'PRMTE_API_KEY'")
 
+        self.cache_dir = (cache_dir or os.environ.get('PRMTE_CACHE_DIR') or self.CACHE_DIR) if use_cache else None
+
+        # Shared session so consecutive (and concurrent) calls reuse keep-alive connections.
+        # Transient server errors are retried with backoff, the last response is kept if they persist.
+        self.session = requests.Session()
+        retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504], raise_on_status=False)
+        self.session.mount('https://', HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=retries))
+
     def make_api_call(self, endpoint, params=None, verbose=False):
         if endpoint not in self.ENDPOINTS:
             raise ValueError("Invalid endpoint")
@@ -35,17 +57,59 @@ class PRMTEClient:
         if params is None:
             params = {}
 
+        # Past periods are served from the disk cache when available
+        cache_path = self._cache_path(endpoint, params)
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, 'rb') as f:
+                return json.loads(f.read())
+
         params['user_key'] = self.api_key
-        response = requests.get(url, params=params)
+        response = self.session.get(url, params=params, timeout=self.TIMEOUT)
         if verbose: print(response.url)
 
         # Check for successful status code
         if response.status_code == 200:
-            return response.json()
+            res = response.json()
+            if cache_path and res and self._is_complete(params, res):
+                self._store(cache_path, response.content)
+            return res
         else:
             logging.error(f"{response.status_code}: {response.text}")
             return None
 
+    def _cache_path(self, endpoint, params):
+        """
+        Cache file for a request, keyed by a hash of the endpoint and parameters. Returns None if caching
+        is disabled or the request does not target a period that has already ended.
+        """
+        if not self.cache_dir:
+            return None
+
+        period = params.get('endPeriod') or params.get('periodo') or params.get('period')
+        if not period or str(period)[:6] >= datetime.now().strftime('%Y%m'):
+            return None
+
+        key = '|'.join([endpoint] + [f'{k}={v}' for k, v in sorted(params.items()) if k != 'user_key'])
+        return os.path.join(self.cache_dir, hashlib.blake2s(key.encode()).hexdigest() + '.json')
+
+    def _is_complete(self, params, res):
+        """
+        Whether a response covers its whole period, i.e. its last reading reaches the end of the month.
+        Readings lag behind (up to a day), so a period that just ended may still be incomplete.
+        """
+        period = str(params.get('endPeriod') or params.get('periodo') or params.get('period'))[:6]
+        period_end = datetime.strptime(period, '%Y%m') + relativedelta(months=1) - timedelta(minutes=15)
+        last_readings = [series.get('fechaUltimaLectura') or series.get('lastReadingDate') for series in res]
+        return all(last and pd.Timestamp(last).tz_localize(None) >= period_end for last in last_readings)
+
+    def _store(self, path, content):
+        # Write to a temporary file first, so concurrent readers never see a partial response
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
     def get_15min_readings(self, idPuntoMedida, periodo, last_reading=False):
         """
         Calls the "medidas" endpoint and fetches all 15min readings for a given period.
@@ -56,12 +120,12 @@ class PRMTEClient:
             periodo (str): measurement period (monthly granularity) in YYYYMM format.
 
         Returns:
-            List of records (tuples) with the format (idPuntoMedida, idCanal, date, value).
-            idCanal = 1 corresponds to active energy withdrawls, while idCanal = 3 is for 
-            active energy injections.
+            Records as a dictionary of columns "idPuntoMedida", "canalVal" (idCanal), "date" and "value",
+            or an empty dictionary if there are no measurements. idCanal = 1 corresponds to active energy
+            withdrawls, while idCanal = 3 is for active energy injections.
         
         Units:
-            Date comes in "YYYY-MM-DD HH:MM:SS" format. 
+            Date comes in "YYYY-MM-DD HH:MM:SS" format and is parsed once into datetime64[s] values.
             Value is in kWh units.
         """
         params = {
@@ -76,7 +140,15 @@ class PRMTEClient:
         canales = res[0]['canales']
         medidas = res[0]['mediciones']
         last_reading = res[0]['fechaUltimaLectura']
-        records = [(idPuntoMedida, c['idCanal'], m['intervalo'], m[f'canalVal{c["idCanal"]}']) for c in canales for m in medidas]
+        # Build one array per column (channel after channel) instead of a tuple per record
+        n = len(medidas)
+        dates = np.array([m['intervalo'] for m in medidas], dtype='datetime64[s]')
+        records = {
+            'idPuntoMedida': np.full(n * len(canales), idPuntoMedida, dtype=object),
+            'canalVal': np.repeat(np.array([c['idCanal'] for c in canales], dtype=np.int8), n),
+            'date': np.tile(dates, len(canales)),
+            'value': np.array([m[f'canalVal{c["idCanal"]}'] for c in canales for m in medidas], dtype=np.float64)
+        } if n else {}
         if last_reading: return records, res[0]['fechaUltimaLectura']
         return records
 
@@ -106,8 +178,10 @@ class PRMTEClient:
 
         medidores = res[0]['medidores']
         last_reading = res[0]['fechaUltimaLectura']
-        activa = np.array([medida['canalVal3'] - medida['canalVal1'] if medida['canalVal1'] != None and medida['canalVal3'] != None else np.nan for medida in res[0]['mediciones']])
-        reactiva = np.array([medida['canalVal4'] - medida['canalVal2'] if medida['canalVal4'] != None and medida['canalVal2'] != None else np.nan for medida in res[0]['mediciones']])
+        # Missing readings (None) become NaN and propagate through the subtraction
+        canales = pd.DataFrame(res[0]['mediciones'], columns=['canalVal1', 'canalVal2', 'canalVal3', 'canalVal4']).astype(np.float64)
+        activa = canales['canalVal3'].to_numpy() - canales['canalVal1'].to_numpy()
+        reactiva = canales['canalVal4'].to_numpy() - canales['canalVal2'].to_numpy()
         nan_values = np.isnan(activa).any() | np.isnan(reactiva).any()
         return nan_values, last_reading, np.nansum(activa), np.nansum(reactiva)
 
@@ -126,10 +200,11 @@ class PRMTEClient:
 
         Returns
         -------
-        Tuple[list, str]
-            List of tuples ``(measurePointId, channelId, date, value)`` and
-            the last reading timestamp provided by the API.  Returns an empty
-            list if no data is returned.
+        Tuple[dict, str]
+            Dictionary of columns ``idPuntoMedida`` (measurePointId),
+            ``canalVal`` (channelId), ``date`` and ``value``, and the last
+            reading timestamp provided by the API.  Returns an empty
+            dictionary if no data is returned.
         """
 
         params = {
@@ -141,17 +216,29 @@ class PRMTEClient:
 
         res = self.make_api_call('measurement', params=params)
         if not res:
-            return [], None
+            return {}, None
 
-        records = []
+        # Build one list per column (channel after channel) instead of a tuple per record
+        ids, channels, dates, values = [], [], [], []
         last_reading = None
         for series in res:
             last_reading = series.get('lastReadingDate')
-            for measurement in series.get('measurement', []):
-                ts = measurement['dateRange']
-                for ch in series.get('channel', []):
-                    cid = ch['channelId']
-                    val = measurement.get(f'channel{cid}', 0)
-                    records.append((series['measurePointId'], cid, ts, val))
-
+            measurements = series.get('measurement', [])
+            timestamps = [measurement['dateRange'] for measurement in measurements]
+            for ch in series.get('channel', []):
+                cid = ch['channelId']
+                ids.extend([series['measurePointId']] * len(measurements))
+                channels.extend([cid] * len(measurements))
+                dates.extend(timestamps)
+                values.extend(measurement.get(f'channel{cid}', 0) for measurement in measurements)
+
+        if not values:
+            return {}, last_reading
+
+        records = {
+            'idPuntoMedida': ids,
+            'canalVal': np.array(channels, dtype=np.int8),
+            'date': dates,
+            'value': np.array(values, dtype=np.float64)
+        }
         return records, last_reading
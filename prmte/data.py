@@ -1,12 +1,17 @@
+import numpy as np
 import pandas as pd 
 
-def transform_records(records, last_reading=None, format='consolidated'):
+def transform_records(records, last_reading=None, format='consolidated', drop_id=False):
     """
     Transforms records coming from the 'get_15min_readings' method from PRMTEClient class in core package. 
 
     Args:
-        records (list): list of tuples containing measurement records. See 'get_15min_readings' method.
+        records (dict or list): measurement records, either as a dictionary of columns (dates may already
+            be parsed) or as a list of (idPuntoMedida, canalVal, date, value) tuples. See 'get_15min_readings'
+            method.
         format (str): format of output Pandas DataFrame. Either 'consolidated' or 'columns'.
+        drop_id (bool): for records of a single measurement point. If True, "idPuntoMedida" is dropped and
+            the output DataFrame is indexed by date in both formats, ready to be resampled.
 
     Returns: 
         A Pandas DataFrame containing all measurement records. Depending on the format chosen:
@@ -18,32 +23,49 @@ def transform_records(records, last_reading=None, format='consolidated'):
             if 'columns', output DataFrame has columns "idPuntoMedida", date (DateTime column), "Retiros"
             for energy withdrawls in kWh and "Inyecciones" for energy injections during that interval.
     """
-    df = pd.DataFrame(records, columns=['idPuntoMedida', 'canalVal', 'date', 'value'])
-    df['date'] = pd.to_datetime(df['date'])
+    # Column arrays are wrapped as they are, without copying
+    df = pd.DataFrame(records, columns=['idPuntoMedida', 'canalVal', 'date', 'value'], copy=False)
+    # Dates not parsed by the client come as "YYYY-MM-DD HH:MM:SS", use the ISO8601 fast path instead of inferring the format
+    if not pd.api.types.is_datetime64_any_dtype(df['date']):
+        df['date'] = pd.to_datetime(df['date'], format='ISO8601', cache=True)
+    # Both formats group by date (which sorts it), so records are only cut at the last reading.
+    # Sorted dates are cut with a binary search, otherwise (e.g. channel after channel) with a mask.
     if last_reading:
-        df = df.set_index('date').sort_index().loc[:last_reading].reset_index()
-    else:
-        df = df.set_index('date').sort_index().reset_index()
+        if df['date'].is_monotonic_increasing:
+            df = df.iloc[:df['date'].searchsorted(last_reading, side='right')]
+        else:
+            df = df[df['date'] <= last_reading]
     
+    # Compact dtypes: a few channels, and a single (or a few) measurement points repeated on every record
+    df['canalVal'] = df['canalVal'].astype(np.int8, copy=False)
+    if not drop_id:
+        df['idPuntoMedida'] = df['idPuntoMedida'].astype('category')
+
     # By default withdrawls are negative values indicating the direction of energy flow
-    df['value'] = df.apply(lambda row: -row['value'] if row['canalVal'] == 1 else row['value'], axis=1)
+    values = df['value'].to_numpy()
+    df['value'] = np.where(df['canalVal'].to_numpy() == 1, -values, values)
 
     if format == 'consolidated':
         # Not actually invalid, you can inject and withdraw energy during the same period
         #invalid_groups = df.groupby(['idPuntoMedida', 'date']).filter(lambda group: group['value'].ne(0).sum() > 1)
-        df = df.groupby(['idPuntoMedida', 'date']).sum().reset_index().drop(columns=['canalVal'])
-        df.set_index('date', inplace=True)
+        if drop_id:
+            df = df.groupby('date')[['value']].sum()
+        else:
+            df = df.groupby(['idPuntoMedida', 'date'], observed=True)[['value']].sum().reset_index()
+            df.set_index('date', inplace=True)
 
     elif format == 'columns':
-        df = (
-            df.pivot_table(
-                index=['idPuntoMedida', 'date'],
-                columns='canalVal',
-                values='value',
-                fill_value=0,
-            )
-            .reset_index()
-        )
+        # One value per (idPuntoMedida, date, canalVal), a plain reshape avoids pivot_table's aggregation
+        keys = ['date', 'canalVal'] if drop_id else ['idPuntoMedida', 'date', 'canalVal']
+        values = df.set_index(keys)['value']
+        try:
+            df = values.unstack('canalVal')
+        except ValueError:
+            # Duplicated entries (e.g. repeated hours on DST changes) are averaged, as pivot_table did
+            df = values.groupby(level=keys, observed=True).mean().unstack('canalVal')
+        df = df.dropna(how='all').fillna(0)
+        if not drop_id:
+            df = df.reset_index()
         df.rename(columns={1: 'Retiros', 3: 'Inyecciones'}, inplace=True)
 
     return df
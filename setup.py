@@ -12,7 +12,7 @@ setup(
     author_email='matias.galetovic@toesca.com',
     url='https://github.com/toesca-dev/tpower/',
     install_requires=[
-        'requests', 'pandas', 'numpy'
+        'requests', 'pandas', 'numpy', 'orjson'
     ],
     classifiers=[
         'Development Status :: 2 - Pre-Alpha',